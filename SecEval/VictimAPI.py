@@ -1,25 +1,121 @@
 import tensorflow as tf
 import numpy as np
 import os
+import scipy.fftpack
 import ds_ctcdecoder
 
 from abc import ABC
+from functools import lru_cache
 from multiprocessing import cpu_count
-from cleverspeech.utils.Utils import np_arr, lcomp, log
+from cleverspeech.utils.Utils import log
 
 import DeepSpeech
 from util.config import Config
 from util.text import Alphabet
 
 
+def _available_cpus():
+    try:
+        # respects cpuset limits (e.g. containers, SLURM allocations)
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # not available on macOS
+        return cpu_count()
+
+
+# python_speech_features swaps zero energies for float64 eps before the log,
+# use the same floor (as float32) to keep silence frames identical.
+LOG_EPS = np.float32(np.finfo(float).eps)
+
+# Set DS_DECODE_WORKERS to leave some cores free on a shared machine.
+_DEFAULT_WORKERS = int(os.environ.get("DS_DECODE_WORKERS", _available_cpus()))
+
+# Set DS_FRONTEND_BF16=1 to run the mel filterbank matmul in bfloat16 by default.
+# Off until the WER impact has been checked against the fp32 frontend.
+_FRONTEND_BF16 = os.environ.get("DS_FRONTEND_BF16", "0") == "1"
+
+# Set DS_XLA_JIT=0 to turn off XLA compilation of the MFCC + DeepSpeech graph.
+# DS_XLA_JIT=auto also sets TF_XLA_FLAGS=--tf_xla_auto_jit=2 (if it isn't set
+# already) for sessions that weren't created with `session_config()`. N.B. that
+# auto-JITs *every* graph in the process, not just the DeepSpeech one.
+_XLA_JIT_MODE = os.environ.get("DS_XLA_JIT", "1")
+_XLA_JIT = _XLA_JIT_MODE in ("1", "auto")
+
+if _XLA_JIT_MODE == "auto":
+    os.environ.setdefault("TF_XLA_FLAGS", "--tf_xla_auto_jit=2")
+
+
+def session_config(**kwargs):
+    """
+    A `tf.ConfigProto` for the session passed to `Model`, with XLA JIT
+    turned on (unless DS_XLA_JIT=0). Any kwargs go to `tf.ConfigProto`.
+    """
+    config = tf.ConfigProto(**kwargs)
+    if _XLA_JIT:
+        config.graph_options.optimizer_options.global_jit_level = (
+            tf.OptimizerOptions.ON_2
+        )
+    return config
+
+
+# The MFCC constants only depend on the (fixed) transform settings, so compute
+# them once per process rather than every time a batch's graph gets built.
+# N.B. the cached arrays are shared -- don't modify them in place.
+
+@lru_cache(maxsize=8)
+def _hamming(n):
+    return np.hamming(n).astype(np.float32)
+
+
+@lru_cache(maxsize=8)
+def _lifter(n_ceps, cep_lifter):
+    n = np.arange(n_ceps)
+    return 1 + (cep_lifter / 2.) * np.sin(np.pi * n / cep_lifter)
+
+
+@lru_cache(maxsize=8)
+def _filter_bank(filepath):
+    return np.load(filepath).T.astype(np.float32)
+
+
+@lru_cache(maxsize=8)
+def _dct_lift(n_filters, n_ceps, cep_lifter):
+    """
+    The DCT and the lifter are both linear so fold them into a single
+    [n_filters, n_ceps - 1] matrix. The 0th coefficient is left out as it gets
+    replaced by the energy anyway.
+    """
+    dct = scipy.fftpack.dct(
+        np.eye(n_filters), type=2, norm='ortho'
+    )[:, :n_ceps]
+    return (dct * _lifter(n_ceps, cep_lifter))[:, 1:].astype(np.float32)
+
+
+def _scipy_power_spectrum(windowed, n):
+    """
+    Host side equivalent of the TF rfft power spectrum, pocketfft is faster
+    than TF's Eigen FFT for these frame sizes on CPU.
+
+    Imported here as `scipy.fft` needs scipy >= 1.4 and this path is opt-in.
+    """
+    import scipy.fft
+
+    ffted = scipy.fft.rfft(windowed, n=n, axis=-1)
+    return (1.0 / n * np.square(np.abs(ffted))).astype(np.float32)
+
+
 class CarliniWagnerTransforms:
-    def __init__(self, audio_tensor, batch_size, sample_rate=16000, n_context=9, n_ceps=26, cep_lift=22):
+    def __init__(self, audio_tensor, batch_size, sample_rate=16000, n_context=9, n_ceps=26, cep_lift=22, use_bf16=_FRONTEND_BF16, use_scipy_fft=False):
         """
         Carlini & Wagners implementation of MFCC & windowing in tensorflow
         :param audio_tensor: the input audio tensor/variable
         :param audio_data: the DataLoader.AudioData test_data class
         :param batch_size: the size of the test data batch
         :param sample_rate: sample rate of the input audio files
+        :param use_bf16: compute the mel filterbank in bfloat16
+        :param use_scipy_fft: compute the FFT with scipy outside of TF (needs
+            scipy >= 1.4). There are no gradients through this so don't use it
+            for attacks.
         """
         self.filter_bank_filepath = os.path.abspath(os.path.dirname(__file__))
         self.filter_bank_filepath = os.path.join(
@@ -35,6 +131,27 @@ class CarliniWagnerTransforms:
 
         self.audio_input = audio_tensor
         self.batch_size = batch_size
+        self.use_bf16 = use_bf16
+        self.use_scipy_fft = use_scipy_fft
+
+        # number of MFCC frames, None if the audio length isn't static
+        audio_len = audio_tensor.get_shape().as_list()[1]
+        if audio_len is None:
+            self.n_frames = None
+        else:
+            self.n_frames = (audio_len - self.window_size) // self.window_step + 1
+
+        self._pre_emphasis = tf.constant(
+            np.array([-0.97, 1], dtype=np.float32).reshape(2, 1, 1)
+        )
+        self._hamming = tf.constant(_hamming(self.window_size))
+        filter_bank = _filter_bank(self.filter_bank_filepath)
+        self._filter_bank = tf.constant(
+            filter_bank, dtype=tf.bfloat16 if use_bf16 else tf.float32
+        )
+        self._dct_lift = tf.constant(
+            _dct_lift(filter_bank.shape[1], self.n_ceps, self.cep_lifter)
+        )
 
         self.mfcc = None
         self.windowed = None
@@ -42,15 +159,6 @@ class CarliniWagnerTransforms:
         self.features_shape = None
         self.features_len = None
 
-    def _window_generator(self, audio, size):
-        for i in range(0, size - self.window_step, self.window_step):
-            a = audio[:, i:i + self.window_size]
-            yield a
-
-    def _context_generator(self, feats):
-        for i in range(0, feats.shape[1] - self.tot_contexts * self.n_ceps + 1, self.n_ceps):
-            yield feats[:, i:i + self.tot_contexts * self.n_ceps]
-
     def mfcc_ops(self):
         """
         Compute the MFCC for a given audio waveform. This is
@@ -58,45 +166,62 @@ class CarliniWagnerTransforms:
         TensorFlow so that we can differentiate through it.
         """
 
-        batch_size = self.batch_size
         audio = tf.cast(self.audio_input, tf.float32)
 
         # 1. Pre-emphasizer, a high-pass filter
-        audio = tf.concat((audio[:, :1], audio[:, 1:] - 0.97 * audio[:, :-1]), 1)
+        # y[t] = x[t] - 0.97 * x[t-1] as a length 2 FIR filter. Padding one
+        # zero on the left means y[0] = x[0], same as DeepSpeech.
+        audio = tf.pad(audio, [[0, 0], [1, 0]])
+        audio = tf.nn.conv1d(
+            audio[:, :, None], self._pre_emphasis, 1, 'VALID', name="qq_preemph"
+        )[:, :, 0]
 
         # 2. windowing into frames of 320 samples, overlapping
         windows = tf.signal.frame(
             audio, self.window_size, self.window_step, axis=-1, name="qq_frame"
         )
-        window = np.hamming(self.window_size)
-        self.windowed = windowed = windows * window
+        self.windowed = windowed = windows * self._hamming
 
         # 3. Take the FFT to convert to frequency space
-        ffted = tf.spectral.rfft(windowed, [self.window_size])
-        ffted = 1.0 / self.window_size * tf.square(tf.abs(ffted))
+        if self.use_scipy_fft:
+            # py_func has no XLA kernel, keep it out of any enclosing jit scope
+            with tf.contrib.compiler.jit.experimental_jit_scope(compile_ops=False):
+                ffted = tf.py_func(
+                    lambda w: _scipy_power_spectrum(w, self.window_size),
+                    [windowed],
+                    tf.float32,
+                    stateful=False,
+                    name="qq_scipy_rfft"
+                )
+            ffted.set_shape(
+                windowed.get_shape()[:-1].concatenate([self.window_size // 2 + 1])
+            )
+        else:
+            ffted = tf.signal.rfft(windowed, [self.window_size])
+            ffted = 1.0 / self.window_size * tf.square(tf.abs(ffted))
 
         # 4. Compute the Mel windowing of the FFT
-        energy = tf.reduce_sum(ffted, axis=2) + np.finfo(float).eps
+        energy = tf.reduce_sum(ffted, axis=2)
 
-        filters = np.load(self.filter_bank_filepath).T
-        filters = np_arr([filters for i in range(0, batch_size)], np.float32)
-
-        feat = tf.matmul(ffted, filters) + np.finfo(float).eps
+        if self.use_bf16:
+            # no bfloat16 FFT in TF so only the (memory bound) mel matmul is
+            # done at reduced precision, the log needs fp32 again
+            feat = tf.tensordot(
+                tf.cast(ffted, tf.bfloat16), self._filter_bank, axes=[[2], [0]]
+            )
+            feat = tf.cast(feat, tf.float32)
+        else:
+            feat = tf.tensordot(ffted, self._filter_bank, axes=[[2], [0]])
 
         # 5. Take the DCT again, because why not
-        feat = tf.log(feat)
-        feat = tf.spectral.dct(feat, type=2, norm='ortho')[:, :, :self.n_ceps]
-
         # 6. Amplify high frequencies for some reason
-        _, n_frames, n_coeff = feat.get_shape().as_list()
-        n = np.arange(n_coeff)
-        lift = 1 + (self.cep_lifter/ 2.) * np.sin(np.pi * n / self.cep_lifter)
-        feat = lift * feat
-        width = feat.get_shape().as_list()[1]
+        # (both done in one matmul, see `self._dct_lift`)
+        feat = tf.math.log(tf.maximum(feat, LOG_EPS))
+        feat = tf.tensordot(feat, self._dct_lift, axes=[[2], [0]])
 
         # 7. And now stick the energy next to the features
         self.mfcc = tf.concat(
-            (tf.reshape(tf.log(energy), (-1, width, 1)), feat[:, :, 1:]),
+            (tf.math.log(tf.maximum(energy, LOG_EPS))[:, :, None], feat),
             axis=2
         )
 
@@ -118,20 +243,45 @@ class CarliniWagnerTransforms:
 
         batch_size = self.batch_size
 
-        eye_filter = np.asarray(
-            np.eye(self.tot_contexts * self.n_ceps).reshape(
-                self.tot_contexts, self.n_ceps, self.tot_contexts * self.n_ceps),
-                 np.float32
+        # zero-pad n_contexts empty frames either side (same as the 'SAME'
+        # padding of DeepSpeech's identity filter conv) then take a strided
+        # view over the flattened features -- one frame per time step.
+        features = tf.pad(
+            self.mfcc, [[0, 0], [self.n_contexts, self.n_contexts], [0, 0]]
+        )
+        features = tf.reshape(features, [batch_size, -1])
+
+        contexts = tf.signal.frame(
+            features,
+            self.tot_contexts * self.n_ceps,
+            self.n_ceps,
+            axis=-1,
+            name="qq_contexts"
         )
-
-        contexts = tf.nn.conv1d(self.mfcc, eye_filter, 1, 'SAME', name="qq_conv")
 
         self.features = tf.reshape(
-            contexts, [batch_size, -1, self.tot_contexts, self.n_ceps]
+            contexts,
+            [
+                batch_size,
+                -1 if self.n_frames is None else self.n_frames,
+                self.tot_contexts,
+                self.n_ceps
+            ]
         )
 
 
 class Model(ABC):
+
+    # The KenLM scorer and alphabet only depend on files on disk and the
+    # alpha / beta flags, so share them between instances -- loading the LM
+    # is far more expensive than decoding a small batch.
+    _scorer_cache = {}
+    _alphabet_cache = {}
+
+    # Resolving the latest checkpoint reads the checkpoint state file, the
+    # path doesn't change between batches so only do it once.
+    _checkpoint_path_cache = {}
+
     def __init__(self, sess, input_tensor, batch, beam_width=500, decoder='ds', tokens=" abcdefghijklmnopqrstuvwxyz'-"):
 
         self.sess = sess
@@ -151,12 +301,13 @@ class Model(ABC):
         )
 
         self.tokens = tokens
+        self._token_lookups = {}
         self.decoder = decoder
         self.beam_width = beam_width
         # beam_width = tf.app.flags.FLAGS.beam_width
         self.feature_extraction = None
         self.raw_logits = None
-        self.logits = None
+        self._logits = None
         self.inputs = None
         self.outputs = None
         self.layers = None
@@ -189,16 +340,31 @@ class Model(ABC):
 
         DeepSpeech.initialize_globals()
 
-        self.alphabet = Alphabet(
-            os.path.abspath(tf.app.flags.FLAGS.alphabet_config_path))
+        alphabet_path = os.path.abspath(
+            tf.app.flags.FLAGS.alphabet_config_path
+        )
+        if alphabet_path not in Model._alphabet_cache:
+            Model._alphabet_cache[alphabet_path] = Alphabet(alphabet_path)
 
-        self.scorer = ds_ctcdecoder.Scorer(
-            tf.app.flags.FLAGS.lm_alpha,
-            tf.app.flags.FLAGS.lm_beta,
+        self.alphabet = Model._alphabet_cache[alphabet_path]
+
+        scorer_key = (
             tf.app.flags.FLAGS.lm_binary_path,
             tf.app.flags.FLAGS.lm_trie_path,
-            self.alphabet
+            tf.app.flags.FLAGS.lm_alpha,
+            tf.app.flags.FLAGS.lm_beta,
+            alphabet_path,
         )
+        if scorer_key not in Model._scorer_cache:
+            Model._scorer_cache[scorer_key] = ds_ctcdecoder.Scorer(
+                tf.app.flags.FLAGS.lm_alpha,
+                tf.app.flags.FLAGS.lm_beta,
+                tf.app.flags.FLAGS.lm_binary_path,
+                tf.app.flags.FLAGS.lm_trie_path,
+                self.alphabet
+            )
+
+        self.scorer = Model._scorer_cache[scorer_key]
 
     def initialise(self):
         """
@@ -209,6 +375,9 @@ class Model(ABC):
         If we don't do this then the previous state is passed between different
         batches and can lead to weird issues like low decoder confidence scores
         or misspellings in transcriptions.
+
+        The scorer and alphabet are cached on the class, so tearing down the
+        flags here does not force the language model to be reloaded.
         """
         try:
             # does a flag value currently exist?
@@ -228,20 +397,26 @@ class Model(ABC):
 
         log("Creating DeepSpeech model graph.", wrap=False)
 
-        self.feature_extraction = CarliniWagnerTransforms(
-            input_tensor,
-            batch_size
-        )
-        self.feature_extraction.mfcc_ops()
-        self.feature_extraction.window_ops()
-
-        inputs, outputs, layers = DeepSpeech.create_inference_graph(
-            input_tensor=self.feature_extraction.features,
-            seq_length=seq_length,
-            n_steps=-1,
-            batch_size=batch_size,
-            tflite=False
-        )
+        # the shapes are fixed per batch so let XLA fuse the (memory bound)
+        # MFCC ops and the model. The CTC decoders have no XLA kernels so are
+        # built outside of this scope (as is the optional scipy FFT py_func,
+        # see `CarliniWagnerTransforms.mfcc_ops`).
+        with tf.contrib.compiler.jit.experimental_jit_scope(compile_ops=_XLA_JIT):
+
+            self.feature_extraction = CarliniWagnerTransforms(
+                input_tensor,
+                batch_size
+            )
+            self.feature_extraction.mfcc_ops()
+            self.feature_extraction.window_ops()
+
+            inputs, outputs, layers = DeepSpeech.create_inference_graph(
+                input_tensor=self.feature_extraction.features,
+                seq_length=seq_length,
+                n_steps=-1,
+                batch_size=batch_size,
+                tflite=False
+            )
         self.inputs = inputs
         self.outputs = outputs
         self.layers = layers
@@ -250,10 +425,44 @@ class Model(ABC):
         self.reset_state()
 
         self.raw_logits = layers['raw_logits']
-        self.logits = tf.transpose(outputs['outputs'], [1, 0, 2])
+
+        self.create_decoder_graph()
 
         log("DeepSpeech model graph created.", wrap=True)
 
+    def create_decoder_graph(self):
+        """
+        Build the TF CTC decoders once so `tf_beam_decode` and
+        `tf_greedy_decode` only have to `sess.run` them. Logits and sequence
+        lengths are fed in at run time.
+
+        N.B. the beam decoder is fixed to the `beam_width` at graph creation.
+        """
+
+        self._seq_len_ph = tf.placeholder(
+            tf.int32, [None], name="qq_decoder_seq_len"
+        )
+
+        beam_decoded, self._beam_log_probs = tf.nn.ctc_beam_search_decoder(
+            self.raw_logits,
+            self._seq_len_ph,
+            merge_repeated=False,
+            beam_width=self.beam_width
+        )
+        self._beam_decoded = beam_decoded[0]
+
+        self._greedy_decoded = {}
+        self._greedy_log_probs = {}
+
+        for merge_repeated in (True, False):
+            greedy_decoded, log_probs = tf.nn.ctc_greedy_decoder(
+                self.outputs['outputs'],
+                self._seq_len_ph,
+                merge_repeated=merge_repeated,
+            )
+            self._greedy_decoded[merge_repeated] = greedy_decoded[0]
+            self._greedy_log_probs[merge_repeated] = log_probs
+
     def load_checkpoint(self):
 
         log(
@@ -261,26 +470,56 @@ class Model(ABC):
             wrap=False
         )
 
-        mapping = {
-            v.op.name: v
-            for v in tf.global_variables()
-            if not v.op.name.startswith('previous_state_')
-            and not v.op.name.startswith("qq")
-        }
-
-        self.saver = saver = tf.train.Saver(mapping)
-        checkpoint = tf.train.get_checkpoint_state(self.checkpoint_dir)
+        # A Saver is tied to this instance's graph variables, so only reuse it
+        # if the checkpoint gets restored again.
+        if self.saver is None:
+            mapping = {
+                v.op.name: v
+                for v in tf.global_variables()
+                if not v.op.name.startswith('previous_state_')
+                and not v.op.name.startswith("qq")
+            }
+            self.saver = tf.train.Saver(mapping)
+
+        saver = self.saver
+
+        if self.checkpoint_dir not in Model._checkpoint_path_cache:
+            checkpoint = tf.train.get_checkpoint_state(self.checkpoint_dir)
+
+            if not checkpoint:
+                raise Exception(
+                    'Not a valid checkpoint directory ({})'.format(self.checkpoint_dir)
+                )
 
-        if not checkpoint:
-            raise Exception(
-                'Not a valid checkpoint directory ({})'.format(self.checkpoint_dir)
+            Model._checkpoint_path_cache[self.checkpoint_dir] = (
+                checkpoint.model_checkpoint_path
             )
 
-        checkpoint_path = checkpoint.model_checkpoint_path
+        checkpoint_path = Model._checkpoint_path_cache[self.checkpoint_dir]
         saver.restore(self.sess, checkpoint_path)
 
         log("Restored from checkpoint.", wrap=True)
 
+    @property
+    def logits(self):
+        """
+        Batch major softmax outputs. Only added to the graph when first used,
+        the decoders work from the time major `outputs['outputs']`.
+        """
+        if self._logits is None:
+            self._logits = tf.transpose(self.outputs['outputs'], [1, 0, 2])
+        return self._logits
+
+    def get_batch_major_logits(self, feed):
+        """
+        Fetch the time major softmax outputs and transpose them on the host
+        (a view, the ds decoders copy them into their own buffers anyway).
+        """
+        logits = self.get_logits(self.outputs['outputs'], feed)
+        if logits is not None:
+            logits = np.transpose(logits, [1, 0, 2])
+        return logits
+
     def get_logits(self, logits, feed):
         try:
             assert feed is not None
@@ -293,11 +532,17 @@ class Model(ABC):
     def reset_state(self):
         self.sess.run(self.__reset_rnn_state)
 
-    def tf_run(self, *args, **kwargs):
-        self.reset_state()
-        outs = self.sess.run(*args, **kwargs)
-        self.reset_state()
-        return outs
+    def tf_run(self, fetches, *args, **kwargs):
+        """
+        Run `fetches` with the RNN state reset in the same `sess.run` call.
+
+        The inference graph doesn't feed `previous_state` back into the LSTM
+        so ordering within the run doesn't matter. The state is *not* reset
+        afterwards -- don't rely on it being fresh between calls, it will be
+        reset on the next one.
+        """
+        outs = self.sess.run([self.__reset_rnn_state, fetches], *args, **kwargs)
+        return outs[1]
 
     def inference(self, batch, feed=None, logits=None, decoder=None, top_five=False):
 
@@ -313,29 +558,29 @@ class Model(ABC):
                     "top_five is not implemented for the tf decoder"
                 )
 
-            if logits is None:
-                logits = self.get_logits(self.raw_logits, feed)
-
             decodings = self.tf_beam_decode(
                 logits,
                 batch.audios["ds_feats"],
                 self.tokens,
+                feed=feed,
             )
             return decodings
 
         elif decoder == "ds" or not decoder:
 
             if logits is None:
-                logits = self.get_logits(self.logits, feed)
+                logits = self.get_batch_major_logits(feed)
+
+            # unlike the "batch" decoder this one has always decoded the full
+            # (padded) logits rather than cutting them to the `ds_feats` length
+            decoding_probs = self.ds_decode_batch(
+                logits,
+                [logits.shape[1]],
+            )
 
-            decoding_probs = [
-                self.ds_decode(
-                    logit,
-                ) for logit in logits
-            ]
             if top_five is True:
-                probs = [-decoding_probs[i][0] for i in range(0, 5)]
-                decodings = [decoding_probs[i][1] for i in range(0, 5)]
+                probs = [-decoding_probs[0][i][0] for i in range(0, 5)]
+                decodings = [decoding_probs[0][i][1] for i in range(0, 5)]
             else:
                 probs = -decoding_probs[0][0][0]
                 decodings = decoding_probs[0][0][1]
@@ -345,7 +590,7 @@ class Model(ABC):
         elif decoder == "batch":
 
             if logits is None:
-                logits = self.get_logits(self.logits, feed)
+                logits = self.get_batch_major_logits(feed)
 
             decoding_probs = self.ds_decode_batch(
                 logits,
@@ -370,7 +615,7 @@ class Model(ABC):
         elif decoder == "batch_no_lm":
 
             if logits is None:
-                logits = self.get_logits(self.logits, feed)
+                logits = self.get_batch_major_logits(feed)
 
             decoding_probs = self.ds_decode_batch_no_lm(
                 logits,
@@ -402,7 +647,7 @@ class Model(ABC):
                 )
 
             if logits is None:
-                logits = self.get_logits(self.logits, feed)
+                logits = self.get_batch_major_logits(feed)
 
             decoding_probs = self.ds_decode_batch_no_lm(
                 logits,
@@ -424,7 +669,7 @@ class Model(ABC):
             self.beam_width = 1
 
             if logits is None:
-                logits = self.get_logits(self.logits, feed)
+                logits = self.get_batch_major_logits(feed)
 
             decoding_probs = self.ds_decode_batch(
                 logits,
@@ -443,9 +688,6 @@ class Model(ABC):
                     "top_five is not implemented for greedy decoders"
                 )
 
-            if logits is None:
-                logits = self.get_logits(self.logits, feed)
-
             if type(logits) == np.ndarray and logits.shape[0] == batch.size:
                 # batch major but tf greedy search wants time major
                 logits = np.transpose(logits, [1, 0, 2])
@@ -461,6 +703,7 @@ class Model(ABC):
                 logits,
                 batch.audios["ds_feats"],
                 self.tokens,
+                feed=feed,
             )
             return decodings
 
@@ -470,30 +713,31 @@ class Model(ABC):
             )
 
     def ds_decode(self, logits):
+        """
+        Decode a single example's logits -- a convenience wrapper around
+        `ds_decode_batch` with a batch of one.
+        """
 
-        decoded_probs = ds_ctcdecoder.ctc_beam_search_decoder(
-            np.squeeze(logits),
-            Config.alphabet,
-            self.beam_width,
-            scorer=self.scorer
+        logits = np.squeeze(logits)
+
+        decoded_probs = self.ds_decode_batch(
+            logits[np.newaxis, ...],
+            [logits.shape[0]],
         )
 
-        return decoded_probs
+        return decoded_probs[0]
 
     def ds_decode_batch(self, logits, lengths):
 
         l = lengths[0]
 
-        # I have 6 cores on my development machine -- I also want to do other
-        # things like write papers when running experiments.
-
         decoded_probs = ds_ctcdecoder.ctc_beam_search_decoder_batch(
             logits,
-            np.asarray([l for _ in range(logits.shape[0])], dtype=np.int32),
+            np.full(logits.shape[0], l, dtype=np.int32),
             Config.alphabet,
             self.beam_width,
             scorer=self.scorer,
-            num_processes=cpu_count() // 2
+            num_processes=_DEFAULT_WORKERS
         )
 
         return decoded_probs
@@ -502,54 +746,102 @@ class Model(ABC):
 
         l = lengths[0]
 
-        # I have 6 cores on my development machine -- I also want to do other
-        # things like write papers when running experiments.
-
         decoded_probs = ds_ctcdecoder.ctc_beam_search_decoder_batch(
             logits,
-            np.asarray([l for _ in range(logits.shape[0])], dtype=np.int32),
+            np.full(logits.shape[0], l, dtype=np.int32),
             Config.alphabet,
             self.beam_width,
-            num_processes=cpu_count() // 2
+            num_processes=_DEFAULT_WORKERS
         )
 
         return decoded_probs
 
-    def tf_beam_decode(self, logits, features_lengths, tokens):
+    def _tokens_to_strings(self, decoded, tokens):
+        """
+        Convert a fetched `tf.SparseTensorValue` of token indices into one
+        string per batch item. Decodings are short so this is done on the
+        host rather than padding them out with `tf.sparse.to_dense`.
+        """
 
-        tf_decode, log_probs = tf.nn.ctc_beam_search_decoder(
-            logits,
-            features_lengths,
-            merge_repeated=False,
-            beam_width=self.beam_width
+        tokens_arr = self._token_lookup(tokens)
+
+        indices, values, dense_shape = decoded
+
+        # decoder output indices are sorted by batch item, so split the values
+        # wherever the batch item changes
+        rows = np.split(
+            values, np.searchsorted(indices[:, 0], np.arange(1, dense_shape[0]))
         )
-        dense = tf.sparse.to_dense(tf_decode[0])
-        tf_dense = self.tf_run([dense])
-        tf_outputs = [''.join([
-                tokens[int(x)] for x in tf_dense[0][i]
-            ]) for i in range(tf_dense[0].shape[0])]
+
+        if tokens_arr is None:
+            return [''.join(tokens[int(x)] for x in row) for row in rows]
+
+        return [tokens_arr[row].tobytes().decode('ascii') for row in rows]
+
+    def _token_lookup(self, tokens):
+        """
+        Byte array for looking up ASCII tokens with a single NumPy index,
+        built on first use. None for non-ASCII tokens, which have to be
+        joined character by character instead.
+        """
+
+        if tokens not in self._token_lookups:
+            try:
+                lookup = np.frombuffer(tokens.encode('ascii'), dtype=np.uint8)
+            except UnicodeEncodeError:
+                lookup = None
+            self._token_lookups[tokens] = lookup
+
+        return self._token_lookups[tokens]
+
+    def _decoder_feed(self, logits_tensor, logits, features_lengths, feed):
+        """
+        Build the feed for the pinned decoder graph. If `logits` are given
+        they're fed in place of `logits_tensor`, otherwise the decoder reads
+        the model's own (time major) output.
+        """
+
+        feed_dict = {} if feed is None else dict(feed)
+        feed_dict[self._seq_len_ph] = features_lengths
+
+        if type(logits) == tf.Tensor:
+            logits = self.tf_run(logits, feed_dict=feed)
+
+        if logits is not None:
+            feed_dict[logits_tensor] = logits
+
+        return feed_dict
+
+    def tf_beam_decode(self, logits, features_lengths, tokens, feed=None):
+
+        feed_dict = self._decoder_feed(
+            self.raw_logits, logits, features_lengths, feed
+        )
+        tf_decoded, probs = self.tf_run(
+            [self._beam_decoded, self._beam_log_probs], feed_dict=feed_dict
+        )
+        tf_outputs = self._tokens_to_strings(tf_decoded, tokens)
 
         tf_outputs = [o.rstrip(" ") for o in tf_outputs]
 
-        probs = self.tf_run(log_probs)
         probs = [prob[0] for prob in probs]
         return tf_outputs, probs
 
-    def tf_greedy_decode(self, logits, features_lengths, tokens, merge_repeated=True):
+    def tf_greedy_decode(self, logits, features_lengths, tokens, merge_repeated=True, feed=None):
 
-        tf_decode, log_probs = tf.nn.ctc_greedy_decoder(
-            logits,
-            features_lengths,
-            merge_repeated=merge_repeated,
+        feed_dict = self._decoder_feed(
+            self.outputs['outputs'], logits, features_lengths, feed
+        )
+        tf_decoded, neg_sum_logits = self.tf_run(
+            [
+                self._greedy_decoded[merge_repeated],
+                self._greedy_log_probs[merge_repeated]
+            ],
+            feed_dict=feed_dict
         )
-        dense = tf.sparse.to_dense(tf_decode[0])
-        tf_dense = self.tf_run([dense])
-        tf_outputs = [''.join([
-                tokens[int(x)] for x in tf_dense[0][i]
-            ]) for i in range(tf_dense[0].shape[0])]
+        tf_outputs = self._tokens_to_strings(tf_decoded, tokens)
 
         tf_outputs = [o.rstrip(" ") for o in tf_outputs]
 
-        neg_sum_logits = self.tf_run(log_probs)
         neg_sum_logits = [prob[0] for prob in neg_sum_logits]
         return tf_outputs, neg_sum_logits